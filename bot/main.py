@@ -1,22 +1,31 @@
 import os
+import time
+import json
 import tempfile
 import logging
 import re
 import asyncio
-import subprocess
 from datetime import datetime
+from functools import partial
 from dataclasses import dataclass
 
 import aiohttp
 import aiosqlite
-from aiogram import Bot, Dispatcher, F
+import httpx
+from aiogram import BaseMiddleware, Bot, Dispatcher, F
+from aiogram.client.default import DefaultBotProperties
+from aiogram.enums import ParseMode
 from aiogram.types import Message, CallbackQuery, InlineKeyboardMarkup, InlineKeyboardButton, ChatMemberUpdated
 from aiogram.filters import ChatMemberUpdatedFilter, Command, CommandStart, IS_NOT_MEMBER, IS_MEMBER, ADMINISTRATOR
 from aiogram.fsm.context import FSMContext
 from aiogram.fsm.state import State, StatesGroup
 from aiogram.exceptions import TelegramBadRequest
 from aiogram.utils.keyboard import InlineKeyboardBuilder
-from groq import Groq, RateLimitError, APIStatusError
+from aiogram.webhook.aiohttp_server import SimpleRequestHandler, setup_application
+from aiohttp import web
+from aiolimiter import AsyncLimiter
+from cachetools import TTLCache
+from groq import AsyncGroq, RateLimitError, APIStatusError
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -29,6 +38,13 @@ GROQ_API_KEY = os.getenv("GROQ_API_KEY")
 GROQ_API_KEY_2 = os.getenv("GROQ_API_KEY_2")  # Запасной ключ
 CHANNEL_ID = os.getenv("CHANNEL_ID", "@ClevVPN")
 CLEVVPN_API_URL = os.getenv("CLEVVPN_API_URL", "http://89.111.143.90:8080")
+REDIS_URL = os.getenv("REDIS_URL")  # Опционально: общее хранилище расшифровок
+
+# Опционально: режим webhook вместо long-polling. WEBHOOK_URL — публичный
+# адрес, на который Telegram шлёт апдейты (например https://bot.example.com/tg),
+# бот слушает путь из этого URL на WEBHOOK_PORT (за nginx/реверс-прокси)
+WEBHOOK_URL = os.getenv("WEBHOOK_URL")
+WEBHOOK_PORT = int(os.getenv("WEBHOOK_PORT", "8081"))
 
 # Админы бота
 ADMIN_IDS = [586107799, 762967142, 6682411163]
@@ -39,24 +55,50 @@ DB_PATH = os.path.join(os.path.dirname(__file__), "bot.db")
 if not BOT_TOKEN or not GROQ_API_KEY:
     raise ValueError("BOT_TOKEN and GROQ_API_KEY must be set")
 
-bot = Bot(token=BOT_TOKEN)
+# Markdown по умолчанию — чтобы не передавать parse_mode в каждом вызове
+bot = Bot(token=BOT_TOKEN, default=DefaultBotProperties(parse_mode=ParseMode.MARKDOWN))
 dp = Dispatcher()
 
-# Список Groq клиентов для fallback при rate limit
-groq_clients = [Groq(api_key=GROQ_API_KEY)]
-if GROQ_API_KEY_2:
-    groq_clients.append(Groq(api_key=GROQ_API_KEY_2))
-    logger.info("Загружено 2 GROQ API ключа")
-else:
-    logger.info("Загружен 1 GROQ API ключ (запасной не настроен)")
+# Таймауты обращений к Groq: зависший запрос не должен держать
+# обработчик (и пользователя) вечно. На загрузку аудио даём больше
+GROQ_CHAT_TIMEOUT = 30  # секунд
+GROQ_AUDIO_TIMEOUT = 60
+
+# Общий httpx-клиент и список Groq клиентов (для fallback при rate limit).
+# Создаются лениво при первом запросе: конструкторы httpx/AsyncGroq
+# (TLS-контекст и т.п.) не тормозят импорт модуля и холодный старт
+shared_http: httpx.AsyncClient | None = None
+groq_clients: list[AsyncGroq] = []
+_groq_init_lock = asyncio.Lock()
 
 # Индекс текущего клиента
 current_client_index = 0
 
 
-def get_groq_client() -> Groq:
-    """Возвращает текущий Groq клиент."""
-    return groq_clients[current_client_index]
+async def _ensure_groq_clients() -> list[AsyncGroq]:
+    """Создаёт httpx- и Groq-клиенты при первом обращении (под локом)."""
+    global shared_http
+    if groq_clients:
+        return groq_clients
+
+    async with _groq_init_lock:
+        if not groq_clients:
+            # Пул соединений: TCP+TLS переиспользуются между запросами к Groq
+            # вместо нового рукопожатия на каждый вызов. HTTP_PROXY задаётся,
+            # если до Groq нужно ходить через прокси
+            shared_http = httpx.AsyncClient(
+                proxy=os.getenv("HTTP_PROXY"),
+                http2=True,
+                limits=httpx.Limits(max_connections=100, max_keepalive_connections=50, keepalive_expiry=60.0),
+                timeout=httpx.Timeout(30.0, connect=5.0),
+            )
+            groq_clients.append(AsyncGroq(api_key=GROQ_API_KEY, http_client=shared_http))
+            if GROQ_API_KEY_2:
+                groq_clients.append(AsyncGroq(api_key=GROQ_API_KEY_2, http_client=shared_http))
+                logger.info("Загружено 2 GROQ API ключа")
+            else:
+                logger.info("Загружен 1 GROQ API ключ (запасной не настроен)")
+    return groq_clients
 
 
 def switch_groq_client() -> bool:
@@ -72,21 +114,20 @@ def switch_groq_client() -> bool:
     return False
 
 
-# Для обратной совместимости
-groq_client = groq_clients[0]
-
 
-def call_chat_completion(**kwargs):
+async def call_chat_completion(**kwargs):
     """Вызов chat.completions.create с автоматическим fallback на другой ключ при rate limit."""
     global current_client_index
+    clients = await _ensure_groq_clients()
     tried_clients = set()
 
-    while len(tried_clients) < len(groq_clients):
-        client = groq_clients[current_client_index]
+    while len(tried_clients) < len(clients):
+        client = clients[current_client_index]
         tried_clients.add(current_client_index)
 
         try:
-            return client.chat.completions.create(**kwargs)
+            async with asyncio.timeout(GROQ_CHAT_TIMEOUT):
+                return await client.chat.completions.create(**kwargs)
         except (RateLimitError, APIStatusError) as e:
             error_msg = str(e)
             if "rate_limit" in error_msg.lower() or "429" in error_msg or isinstance(e, RateLimitError):
@@ -97,17 +138,19 @@ def call_chat_completion(**kwargs):
     raise RateLimitError("Все API ключи исчерпали лимит запросов")
 
 
-def call_audio_transcription(**kwargs):
+async def call_audio_transcription(**kwargs):
     """Вызов audio.transcriptions.create с автоматическим fallback на другой ключ при rate limit."""
     global current_client_index
+    clients = await _ensure_groq_clients()
     tried_clients = set()
 
-    while len(tried_clients) < len(groq_clients):
-        client = groq_clients[current_client_index]
+    while len(tried_clients) < len(clients):
+        client = clients[current_client_index]
         tried_clients.add(current_client_index)
 
         try:
-            return client.audio.transcriptions.create(**kwargs)
+            async with asyncio.timeout(GROQ_AUDIO_TIMEOUT):
+                return await client.audio.transcriptions.create(**kwargs)
         except (RateLimitError, APIStatusError) as e:
             error_msg = str(e)
             if "rate_limit" in error_msg.lower() or "429" in error_msg or isinstance(e, RateLimitError):
@@ -121,9 +164,102 @@ def call_audio_transcription(**kwargs):
 # Модель для пересказа, перевода и пунктуации
 LLM_MODEL = "openai/gpt-oss-120b"
 
+# Системные промпты — статичные модульные константы. Байт-в-байт одинаковый
+# префикс между запросами позволяет провайдеру кэшировать его обработку,
+# поэтому всё переменное (язык перевода) уходит в пользовательское сообщение
+SUMMARY_SYSTEM_PROMPT = (
+    "Ты помощник для создания кратких пересказов. Сделай краткий пересказ текста, "
+    "сохранив все важные детали, имена, даты, цифры и ключевые мысли. "
+    "Пиши на том же языке что и оригинал. Выводи только пересказ, без пояснений."
+)
+
+TRANSLATE_SYSTEM_PROMPT = (
+    "Ты переводчик. Переведи текст на язык, указанный в первой строке сообщения. "
+    "Сохрани смысл и стиль оригинала. Выводи только перевод, без пояснений."
+)
+
+PUNCTUATION_SYSTEM_PROMPT = (
+    "Исправь пунктуацию в тексте: добавь точки, запятые, вопросительные и "
+    "восклицательные знаки, заглавные буквы в начале предложений. "
+    "Не меняй слова, не добавляй и не удаляй текст — только расставь знаки препинания. "
+    "Выводи только исправленный текст."
+)
+
+ANALYZE_SYSTEM_PROMPT = (
+    'Ты обрабатываешь расшифровки голосовых сообщений. '
+    'Верни JSON с двумя ключами: "summary" — краткий пересказ текста '
+    'на языке оригинала с сохранением всех важных деталей, имён, дат и цифр; '
+    '"translation" — перевод текста на язык, указанный в первой строке сообщения. '
+    'Никаких пояснений, только JSON.'
+)
+
+# Готовые системные сообщения: один и тот же dict переиспользуется
+# во всех вызовах вместо сборки заново на каждый запрос
+SUMMARY_SYS_MSG = {"role": "system", "content": SUMMARY_SYSTEM_PROMPT}
+TRANSLATE_SYS_MSG = {"role": "system", "content": TRANSLATE_SYSTEM_PROMPT}
+PUNCTUATION_SYS_MSG = {"role": "system", "content": PUNCTUATION_SYSTEM_PROMPT}
+ANALYZE_SYS_MSG = {"role": "system", "content": ANALYZE_SYSTEM_PROMPT}
+
+# Модели распознавания речи: turbo заметно быстрее whisper-large-v3
+# при практически том же качестве, distil — ещё быстрее, но только английский
+WHISPER_MODEL = "whisper-large-v3-turbo"
+WHISPER_MODEL_EN = "distil-whisper-large-v3-en"
+
+
+def pick_whisper_model(language_code: str | None) -> str:
+    """Выбирает модель распознавания по языку пользователя из Telegram."""
+    if language_code and language_code.startswith("en"):
+        return WHISPER_MODEL_EN
+    return WHISPER_MODEL
+
+
+# Сколько храним расшифровку после отправки (кнопки под сообщением
+# к тому моменту уже неактуальны)
+TRANSCRIPTION_TTL = 24 * 3600
+
 # Хранилище расшифровок: {message_id: text}
-# Нужно чтобы при нажатии кнопки знать какой текст обрабатывать
-transcriptions: dict[int, str] = {}
+# Нужно чтобы при нажатии кнопки знать какой текст обрабатывать.
+# TTLCache вместо dict, чтобы память не росла бесконечно.
+transcriptions: TTLCache = TTLCache(maxsize=10_000, ttl=TRANSCRIPTION_TTL)
+
+# Если задан REDIS_URL — расшифровки живут в Redis: переживают рестарт
+# и доступны всем репликам бота. Без него работает in-process кэш выше.
+redis_client = None
+if REDIS_URL:
+    import redis.asyncio as aioredis
+
+    redis_client = aioredis.from_url(REDIS_URL, decode_responses=True)
+    logger.info("Расшифровки хранятся в Redis")
+
+
+async def store_transcription(message_id: int, text: str) -> None:
+    """Сохраняет расшифровку для кнопок пересказа/перевода."""
+    if redis_client is not None:
+        try:
+            await redis_client.setex(f"tx:{message_id}", TRANSCRIPTION_TTL, text)
+            return
+        except Exception as e:
+            logger.warning(f"Redis недоступен, пишем в память: {e}")
+    transcriptions[message_id] = text
+
+
+async def get_transcription(message_id: int) -> str | None:
+    """Возвращает сохранённую расшифровку или None."""
+    if redis_client is not None:
+        try:
+            return await redis_client.get(f"tx:{message_id}")
+        except Exception as e:
+            logger.warning(f"Redis недоступен, читаем из памяти: {e}")
+    return transcriptions.get(message_id)
+
+# Кэши готовых пересказов и переводов: {message_id: summary},
+# {(message_id, target_lang): translation}.
+# Заполняются фоново сразу после расшифровки, чтобы кнопки отвечали мгновенно
+summaries: TTLCache = TTLCache(maxsize=10_000, ttl=24 * 3600)
+translations: TTLCache = TTLCache(maxsize=10_000, ttl=24 * 3600)
+
+# Минимум слов, при котором предлагаем (и заранее считаем) пересказ
+SUMMARY_MIN_WORDS = 20
 
 # Настройки retry
 MAX_RETRIES = 3
@@ -489,57 +625,144 @@ async def safe_edit_message(
         return None
 
 
+# Ограничитель исходящих сообщений: Telegram допускает ~30 msg/s на бота,
+# параллельные отправки не должны пробивать этот потолок
+_send_limiter = AsyncLimiter(30, 1)
+
+
+async def _send_limited(target: Message | CallbackQuery, text: str, **kwargs):
+    async with _send_limiter:
+        return await safe_send_message(target, text, **kwargs)
+
+
+async def send_parts_concurrently(
+    target: Message | CallbackQuery,
+    texts: list[str],
+    reply_markup_last: InlineKeyboardMarkup | None = None,
+) -> None:
+    """
+    Отправляет несколько сообщений параллельно через asyncio.gather,
+    не дожидаясь ответа Telegram на каждое по очереди.
+    Клавиатура (если передана) прикрепляется к последнему сообщению.
+    """
+    await asyncio.gather(*[
+        _send_limited(
+            target,
+            text,
+            reply_markup=reply_markup_last if i == len(texts) - 1 else None,
+        )
+        for i, text in enumerate(texts)
+    ])
+
+
 MAX_MESSAGE_LENGTH = 4000  # Оставляем запас от лимита 4096
 
+# Прекомпилированная регулярка — вызывается на каждое сообщение
+_WORD_RE = re.compile(r'\S+')
+
+
+def _iter_sentences(paragraph: str):
+    """
+    Ленивое разбиение абзаца на предложения: границей считается '.', '!'
+    или '?', за которым идёт пробел. Один проход по строке вместо
+    lookbehind-регулярки и без списка всех предложений в памяти.
+    """
+    start = i = 0
+    n = len(paragraph)
+    while i < n:
+        if paragraph[i] in '.!?' and i + 1 < n and paragraph[i + 1].isspace():
+            yield paragraph[start:i + 1]
+            i += 1
+            while i < n and paragraph[i].isspace():
+                i += 1
+            start = i
+        else:
+            i += 1
+    if start < n:
+        yield paragraph[start:]
+
+
+def has_min_words(text: str, minimum: int) -> bool:
+    """
+    Проверяет, есть ли в тексте хотя бы minimum слов.
+    Останавливается как только порог достигнут — без text.split()
+    со списком всех слов ради одного сравнения.
+    """
+    count = 0
+    for _ in _WORD_RE.finditer(text):
+        count += 1
+        if count >= minimum:
+            return True
+    return False
+
 
 def split_text(text: str, max_length: int = MAX_MESSAGE_LENGTH) -> list[str]:
     """
     Разбивает длинный текст на части, не превышающие max_length.
     Старается разбивать по абзацам, затем по предложениям, затем по словам.
+
+    Текущая часть накапливается в списке кусков и склеивается один раз
+    при сбросе — без квадратичной конкатенации строк на больших текстах.
     """
     if len(text) <= max_length:
         return [text]
 
-    parts = []
-    current_part = ""
+    parts: list[str] = []
+    chunks: list[str] = []  # куски текущей части
+    chunks_len = 0  # суммарная длина кусков
+
+    def flush() -> None:
+        """Склеивает накопленные куски в готовую часть."""
+        nonlocal chunks, chunks_len
+        part = "".join(chunks).strip()
+        if part:
+            parts.append(part)
+        chunks = []
+        chunks_len = 0
+
+    def append(piece: str, sep: str) -> None:
+        """Добавляет кусок к текущей части с разделителем."""
+        nonlocal chunks_len
+        if chunks:
+            chunks.append(sep)
+            chunks_len += len(sep)
+        chunks.append(piece)
+        chunks_len += len(piece)
+
+    def pack_paragraph(paragraph: str) -> None:
+        """Жадно пакует длинный абзац по предложениям, при нужде — по словам."""
+        for sentence in _iter_sentences(paragraph):
+            if len(sentence) > max_length:
+                # Даже предложение слишком длинное - режем по словам
+                for word in sentence.split():
+                    if chunks_len + len(word) + 1 > max_length:
+                        flush()
+                    append(word, " ")
+            else:
+                if chunks_len + len(sentence) + 1 > max_length:
+                    flush()
+                append(sentence, " ")
 
-    # Разбиваем по абзацам
-    paragraphs = text.split('\n\n')
+    # Быстрый путь для «стены текста» от Whisper: без пустых строк
+    # обход по абзацам не нужен — сразу режем по предложениям
+    if '\n\n' not in text:
+        pack_paragraph(text)
+        flush()
+        return parts
 
-    for paragraph in paragraphs:
+    # Разбиваем по абзацам
+    for paragraph in text.split('\n\n'):
         # Если абзац сам по себе слишком длинный
         if len(paragraph) > max_length:
-            # Сначала добавляем то что накопили
-            if current_part:
-                parts.append(current_part.strip())
-                current_part = ""
-
-            # Разбиваем длинный абзац по предложениям
-            sentences = re.split(r'(?<=[.!?])\s+', paragraph)
-            for sentence in sentences:
-                if len(sentence) > max_length:
-                    # Даже предложение слишком длинное - режем по словам
-                    words = sentence.split()
-                    for word in words:
-                        if len(current_part) + len(word) + 1 > max_length:
-                            parts.append(current_part.strip())
-                            current_part = word
-                        else:
-                            current_part += " " + word if current_part else word
-                elif len(current_part) + len(sentence) + 1 > max_length:
-                    parts.append(current_part.strip())
-                    current_part = sentence
-                else:
-                    current_part += " " + sentence if current_part else sentence
-        elif len(current_part) + len(paragraph) + 2 > max_length:
-            parts.append(current_part.strip())
-            current_part = paragraph
+            # Сначала сбрасываем то что накопили
+            flush()
+            pack_paragraph(paragraph)
         else:
-            current_part += "\n\n" + paragraph if current_part else paragraph
-
-    if current_part.strip():
-        parts.append(current_part.strip())
+            if chunks_len + len(paragraph) + 2 > max_length:
+                flush()
+            append(paragraph, "\n\n")
 
+    flush()
     return parts
 
 
@@ -548,36 +771,57 @@ def detect_language(text: str) -> str:
     Определяет язык текста по наличию кириллицы.
     Возвращает 'ru' если >= 30% букв кириллица, иначе 'en'.
 
-    Простая эвристика: считаем процент кириллических символов
-    среди всех буквенных символов в тексте.
+    Один проход по символам без регулярных выражений и промежуточных
+    списков — только два целочисленных счётчика.
     """
-    # Находим все буквы (любого алфавита)
-    letters = re.findall(r'[a-zA-Zа-яА-ЯёЁ]', text)
+    cyrillic = letters = 0
+    for c in text:
+        if 'Ѐ' <= c <= 'ӿ':  # U+0400..U+04FF, включая ёЁ
+            cyrillic += 1
+            letters += 1
+        elif 'a' <= c <= 'z' or 'A' <= c <= 'Z':
+            letters += 1
+
     if not letters:
         return 'ru'  # По умолчанию русский
 
-    # Считаем кириллицу
-    cyrillic = re.findall(r'[а-яА-ЯёЁ]', text)
-    cyrillic_ratio = len(cyrillic) / len(letters)
+    return 'ru' if cyrillic / letters >= 0.3 else 'en'
 
-    return 'ru' if cyrillic_ratio >= 0.3 else 'en'
+
+# Кэш проверок подписки: {user_id: (момент проверки, результат)}
+# Экономит один запрос к Telegram API на каждое сообщение активного
+# пользователя. Отрицательный результат живёт недолго, чтобы только что
+# подписавшийся пользователь не ждал истечения полного TTL
+_sub_cache: dict[int, tuple[float, bool]] = {}
+SUB_CACHE_TTL = 300  # секунд
+SUB_CACHE_NEGATIVE_TTL = 5
 
 
 async def check_channel_subscription(user_id: int) -> bool:
     """
     Проверяет, подписан ли пользователь на канал.
     Возвращает True если подписан, False если нет.
+    Результат кэшируется на SUB_CACHE_TTL секунд.
     """
     if not CHANNEL_ID:
         return True  # Если канал не настроен, пропускаем проверку
 
+    cached = _sub_cache.get(user_id)
+    if cached:
+        ttl = SUB_CACHE_TTL if cached[1] else SUB_CACHE_NEGATIVE_TTL
+        if time.monotonic() - cached[0] < ttl:
+            return cached[1]
+
     try:
         member = await bot.get_chat_member(chat_id=CHANNEL_ID, user_id=user_id)
-        return member.status in ["creator", "administrator", "member"]
+        result = member.status in ["creator", "administrator", "member"]
     except Exception:
         logger.exception("Error checking subscription")
         return False
 
+    _sub_cache[user_id] = (time.monotonic(), result)
+    return result
+
 
 async def check_clevvpn_bot_started(user_id: int) -> bool:
     if not CLEVVPN_API_URL:
@@ -628,7 +872,12 @@ async def send_requirements_message(message: Message) -> None:
     channel_ok, bot_ok = await check_all_requirements(message.from_user.id)
     text = get_requirements_message(channel_ok, bot_ok)
     keyboard = get_requirements_keyboard()
-    await message.answer(text, parse_mode="Markdown", reply_markup=keyboard)
+    await message.answer(text, reply_markup=keyboard)
+
+
+# Кэш собранных клавиатур: построение заново сканирует весь текст
+# (язык + количество слов), а результат для message_id не меняется
+_kb_cache: TTLCache = TTLCache(maxsize=10_000, ttl=24 * 3600)
 
 
 def build_keyboard(text: str, message_id: int) -> InlineKeyboardMarkup:
@@ -640,7 +889,12 @@ def build_keyboard(text: str, message_id: int) -> InlineKeyboardMarkup:
     - Английский текст -> "Перевести на русский"
 
     Кнопка пересказа показывается только если в тексте >= 20 слов.
+    Результат кэшируется по message_id.
     """
+    cached = _kb_cache.get(message_id)
+    if cached:
+        return cached
+
     lang = detect_language(text)
 
     # callback_data содержит действие и message_id через двоеточие
@@ -651,13 +905,14 @@ def build_keyboard(text: str, message_id: int) -> InlineKeyboardMarkup:
     buttons = []
 
     # Кнопка пересказа только для текстов с 20+ слов
-    word_count = len(text.split())
-    if word_count >= 20:
+    if has_min_words(text, SUMMARY_MIN_WORDS):
         buttons.append([InlineKeyboardButton(text="Краткий пересказ", callback_data=f"summary:{message_id}")])
 
     buttons.append([InlineKeyboardButton(text=translate_text, callback_data=f"translate:{target_lang}:{message_id}")])
 
-    return InlineKeyboardMarkup(inline_keyboard=buttons)
+    keyboard = InlineKeyboardMarkup(inline_keyboard=buttons)
+    _kb_cache[message_id] = keyboard
+    return keyboard
 
 
 async def summarize_text(text: str) -> str:
@@ -665,13 +920,10 @@ async def summarize_text(text: str) -> str:
     Создает краткий пересказ текста через LLM.
     Промпт просит сохранить все важное, но сделать текст короче.
     """
-    response = call_chat_completion(
+    response = await call_chat_completion(
         model=LLM_MODEL,
         messages=[
-            {
-                "role": "system",
-                "content": "Ты помощник для создания кратких пересказов. Сделай краткий пересказ текста, сохранив все важные детали, имена, даты, цифры и ключевые мысли. Пиши на том же языке что и оригинал. Выводи только пересказ, без пояснений."
-            },
+            SUMMARY_SYS_MSG,
             {
                 "role": "user",
                 "content": text
@@ -682,6 +934,49 @@ async def summarize_text(text: str) -> str:
     return response.choices[0].message.content
 
 
+async def analyze_text(text: str, target_lang: str) -> dict:
+    """
+    Делает пересказ и перевод одним вызовом LLM.
+
+    Один запрос вместо двух: входной текст (основная часть токенов)
+    обрабатывается один раз. Возвращает dict с ключами
+    "summary" и "translation".
+    """
+    lang_name = "русский" if target_lang == "ru" else "английский"
+
+    response = await call_chat_completion(
+        model=LLM_MODEL,
+        messages=[
+            ANALYZE_SYS_MSG,
+            {
+                "role": "user",
+                "content": f"Язык перевода: {lang_name}.\n\n{text}"
+            }
+        ],
+        temperature=0.3,
+        response_format={"type": "json_object"}
+    )
+    return json.loads(response.choices[0].message.content)
+
+
+async def _precompute_summary(message_id: int, text: str) -> None:
+    """
+    Фоновый предрасчёт пересказа и перевода одним вызовом LLM;
+    ошибки только логируем — кнопки в этом случае посчитают всё на месте.
+    """
+    target_lang = "en" if detect_language(text) == "ru" else "ru"
+    try:
+        result = await analyze_text(text, target_lang)
+    except Exception:
+        logger.exception("Error precomputing summary/translation")
+        return
+
+    if result.get("summary"):
+        summaries[message_id] = result["summary"]
+    if result.get("translation"):
+        translations[(message_id, target_lang)] = result["translation"]
+
+
 async def translate_text(text: str, target_lang: str) -> str:
     """
     Переводит текст на указанный язык через LLM.
@@ -689,16 +984,13 @@ async def translate_text(text: str, target_lang: str) -> str:
     """
     lang_name = "русский" if target_lang == "ru" else "английский"
 
-    response = call_chat_completion(
+    response = await call_chat_completion(
         model=LLM_MODEL,
         messages=[
-            {
-                "role": "system",
-                "content": f"Ты переводчик. Переведи текст на {lang_name} язык. Сохрани смысл и стиль оригинала. Выводи только перевод, без пояснений."
-            },
+            TRANSLATE_SYS_MSG,
             {
                 "role": "user",
-                "content": text
+                "content": f"Язык перевода: {lang_name}.\n\n{text}"
             }
         ],
         temperature=0.3
@@ -711,13 +1003,10 @@ async def fix_punctuation(text: str) -> str:
     Исправляет пунктуацию в тексте через LLM.
     Добавляет точки, запятые, заглавные буквы где нужно.
     """
-    response = call_chat_completion(
+    response = await call_chat_completion(
         model=LLM_MODEL,
         messages=[
-            {
-                "role": "system",
-                "content": "Исправь пунктуацию в тексте: добавь точки, запятые, вопросительные и восклицательные знаки, заглавные буквы в начале предложений. Не меняй слова, не добавляй и не удаляй текст — только расставь знаки препинания. Выводи только исправленный текст."
-            },
+            PUNCTUATION_SYS_MSG,
             {
                 "role": "user",
                 "content": text
@@ -728,177 +1017,236 @@ async def fix_punctuation(text: str) -> str:
     return response.choices[0].message.content
 
 
-@dp.message(F.content_type == "voice")
-async def handle_voice(message: Message) -> None:
-    """Handle voice messages and transcribe them using Whisper."""
-    in_group = is_group_chat(message)
+async def check_requirements_or_prompt(message: Message) -> bool:
+    """
+    Проверяет требования (подписка на канал + запуск бота ClevVPN).
+    При невыполнении отправляет напоминание и возвращает False.
+    """
+    channel_ok, bot_ok = await check_all_requirements(message.from_user.id)
+    if not channel_ok or not bot_ok:
+        await send_requirements_message(message)
+        return False
+    return True
 
-    # В личных чатах проверяем требования, в группах - пропускаем
-    if not in_group:
-        channel_ok, bot_ok = await check_all_requirements(message.from_user.id)
-        if not channel_ok or not bot_ok:
-            await send_requirements_message(message)
-            return
 
-    # Отправляем сообщение и сохраняем его, чтобы потом отредактировать
-    # В группах отвечаем реплаем на исходное сообщение
-    status_msg = await message.answer(
-        "Расшифровываю...",
-        reply_to_message_id=message.message_id if in_group else None
-    )
+# Готовые префиксы заголовков: однопартное сообщение — самый частый путь,
+# там обходимся конкатенацией без форматирования строки
+_HDR_PREFIXES = {
+    "Расшифровка": "**Расшифровка:**\n\n",
+    "Расшифровка видео": "**Расшифровка видео:**\n\n",
+}
 
-    try:
-        # Download voice file
-        file = await bot.get_file(message.voice.file_id)
-        file_bytes = await bot.download_file(file.file_path)
 
-        # Save to temp file (Groq needs a file path)
-        with tempfile.NamedTemporaryFile(suffix=".ogg", delete=False) as tmp:
-            tmp.write(file_bytes.read())
-            tmp_path = tmp.name
+async def reply_with_transcription(
+    message: Message,
+    status_msg: Message,
+    raw_text: str,
+    header: str = "Расшифровка",
+    empty_text: str = "Не удалось распознать речь.",
+) -> None:
+    """
+    Общий «хвост» всех медиа-обработчиков: исправляет пунктуацию,
+    сохраняет текст для кнопок (пересказ/перевод) и отправляет частями.
+    """
+    if not raw_text:
+        await status_msg.edit_text(empty_text)
+        return
+
+    # Исправляем пунктуацию через LLM
+    text = await fix_punctuation(raw_text)
 
-        try:
-            # Transcribe with Whisper via Groq
-            with open(tmp_path, "rb") as audio_file:
-                transcription = call_audio_transcription(
-                    file=(tmp_path, audio_file.read()),
-                    model="whisper-large-v3",
-                )
+    # Сохраняем текст для последующих действий (пересказ/перевод)
+    await store_transcription(status_msg.message_id, text)
 
-            raw_text = transcription.text.strip()
-            if raw_text:
-                # Исправляем пунктуацию через LLM
-                text = await fix_punctuation(raw_text)
+    # Пересказ считаем фоново заранее: к моменту нажатия кнопки
+    # он уже будет готов (или почти готов)
+    if has_min_words(text, SUMMARY_MIN_WORDS):
+        asyncio.create_task(_precompute_summary(status_msg.message_id, text))
 
-                # Сохраняем текст для последующих действий (пересказ/перевод)
-                transcriptions[status_msg.message_id] = text
+    # Разбиваем текст на части если он слишком длинный
+    parts = split_text(text)
+    keyboard = build_keyboard(text, status_msg.message_id)
 
-                # Разбиваем текст на части если он слишком длинный
-                parts = split_text(text)
+    if len(parts) == 1:
+        # Текст умещается в одно сообщение
+        prefix = _HDR_PREFIXES.get(header) or f"**{header}:**\n\n"
+        await safe_edit_message(
+            status_msg,
+            prefix + text,
+            reply_markup=keyboard
+        )
+    else:
+        # Текст слишком длинный - отправляем частями
+        await safe_edit_message(
+            status_msg,
+            f"**{header} (часть 1/{len(parts)}):**\n\n{parts[0]}"
+        )
+        # Остальные части шлём параллельно, клавиатура — на последней
+        await send_parts_concurrently(
+            message,
+            [f"**Часть {i}/{len(parts)}:**\n\n{part}"
+             for i, part in enumerate(parts[1:], start=2)],
+            reply_markup_last=keyboard,
+        )
 
-                if len(parts) == 1:
-                    # Текст умещается в одно сообщение
-                    keyboard = build_keyboard(text, status_msg.message_id)
-                    await safe_edit_message(
-                        status_msg,
-                        f"**Расшифровка:**\n\n{text}",
-                        reply_markup=keyboard
-                    )
-                else:
-                    # Текст слишком длинный - отправляем частями
-                    await safe_edit_message(
-                        status_msg,
-                        f"**Расшифровка (часть 1/{len(parts)}):**\n\n{parts[0]}"
-                    )
-                    for i, part in enumerate(parts[1:], start=2):
-                        if i == len(parts):
-                            # Последняя часть - с кнопками
-                            keyboard = build_keyboard(text, status_msg.message_id)
-                            await safe_send_message(
-                                message,
-                                f"**Часть {i}/{len(parts)}:**\n\n{part}",
-                                reply_markup=keyboard
-                            )
-                        else:
-                            await safe_send_message(
-                                message,
-                                f"**Часть {i}/{len(parts)}:**\n\n{part}"
-                            )
-            else:
-                await status_msg.edit_text("Не удалось распознать речь.")
-        finally:
-            os.unlink(tmp_path)
 
-    except Exception as e:
-        logger.exception("Error transcribing voice message")
-        await safe_edit_message(status_msg, "⚠️ Ошибка при расшифровке. Попробуйте через минуту.", parse_mode=None)
+# Типы сообщений, для которых в личных чатах требуется подписка
+GATED_CONTENT_TYPES = {"voice", "audio", "video", "video_note"}
 
 
-@dp.message(F.content_type == "audio")
-async def handle_audio(message: Message) -> None:
-    """Handle audio files."""
-    # В групповых чатах игнорируем аудиофайлы (только voice и video_note)
-    if is_group_chat(message):
-        return
+class RequirementsMiddleware(BaseMiddleware):
+    """
+    Единая проверка требований для всех медиа-сообщений в личных чатах.
 
-    # Проверяем все требования
-    channel_ok, bot_ok = await check_all_requirements(message.from_user.id)
-    if not channel_ok or not bot_ok:
-        await send_requirements_message(message)
+    Выполняется один раз на update вместо повторения в каждом обработчике;
+    благодаря кэшу check_channel_subscription повторные сообщения не
+    создают лишних запросов к Telegram API.
+    """
+
+    async def __call__(self, handler, event: Message, data: dict):
+        if (
+            event.content_type in GATED_CONTENT_TYPES
+            and not is_group_chat(event)
+            and not await check_requirements_or_prompt(event)
+        ):
+            return None
+        return await handler(event, data)
+
+
+dp.message.middleware(RequirementsMiddleware())
+
+
+async def _transcribe_file(file_id: str, filename: str, language_code: str | None) -> str:
+    """Скачивает файл из Telegram и расшифровывает через Groq."""
+    file = await bot.get_file(file_id)
+    file_bytes = await bot.download_file(file.file_path)
+
+    # Передаём скачанный буфер в Groq как есть — без .read(), который
+    # создал бы лишнюю копию всего аудио; имя файла нужно только для формата
+    transcription = await call_audio_transcription(
+        file=(filename, file_bytes),
+        model=pick_whisper_model(language_code),
+    )
+    return transcription.text.strip()
+
+
+# Коалесцирование одинаковых записей (например, переслали один вирусный
+# войс нескольким ботам-пользователям): по file_unique_id повторные запросы
+# ждут уже запущенную расшифровку или берут недавно готовую из кэша,
+# не тратя время и квоту Whisper заново
+_inflight_transcriptions: dict[str, asyncio.Task] = {}
+_recent_transcriptions: TTLCache = TTLCache(maxsize=50_000, ttl=3600)
+
+
+async def _transcribe_and_reply(
+    message: Message,
+    file_id: str,
+    filename: str,
+    status_msg: Message,
+    file_unique_id: str | None = None,
+) -> None:
+    """Расшифровывает файл (с дедупликацией повторов) и отвечает."""
+    cached = _recent_transcriptions.get(file_unique_id) if file_unique_id else None
+    if cached is not None:
+        await reply_with_transcription(message, status_msg, cached)
         return
 
-    status_msg = await message.answer("Расшифровываю аудио...")
+    task = _inflight_transcriptions.get(file_unique_id) if file_unique_id else None
+    if task is None:
+        task = asyncio.create_task(
+            _transcribe_file(file_id, filename, message.from_user.language_code)
+        )
+        if file_unique_id:
+            _inflight_transcriptions[file_unique_id] = task
+            task.add_done_callback(
+                lambda _t: _inflight_transcriptions.pop(file_unique_id, None)
+            )
 
-    try:
-        file = await bot.get_file(message.audio.file_id)
-        file_bytes = await bot.download_file(file.file_path)
+    raw_text = await task
+    if file_unique_id:
+        _recent_transcriptions[file_unique_id] = raw_text
+    await reply_with_transcription(message, status_msg, raw_text)
 
-        # Get file extension from mime type or default to mp3
-        ext = ".mp3"
-        if message.audio.mime_type:
-            ext_map = {"audio/ogg": ".ogg", "audio/mpeg": ".mp3", "audio/wav": ".wav"}
-            ext = ext_map.get(message.audio.mime_type, ".mp3")
 
-        with tempfile.NamedTemporaryFile(suffix=ext, delete=False) as tmp:
-            tmp.write(file_bytes.read())
-            tmp_path = tmp.name
+# Расширение файла по mime-типу аудио; по умолчанию .mp3
+_EXT_MAP = {"audio/ogg": ".ogg", "audio/mpeg": ".mp3", "audio/wav": ".wav"}
 
-        try:
-            with open(tmp_path, "rb") as audio_file:
-                transcription = call_audio_transcription(
-                    file=(tmp_path, audio_file.read()),
-                    model="whisper-large-v3",
-                )
 
-            raw_text = transcription.text.strip()
-            if raw_text:
-                # Исправляем пунктуацию через LLM
-                text = await fix_punctuation(raw_text)
+@dp.message(F.content_type.in_({"voice", "audio"}))
+async def handle_voice(message: Message) -> None:
+    """Handle voice messages and audio files — общий конвейер расшифровки."""
+    in_group = is_group_chat(message)
 
-                # Сохраняем текст для последующих действий
-                transcriptions[status_msg.message_id] = text
+    if message.voice:
+        filename = "voice.ogg"
+        status_text = "Расшифровываю..."
+    else:
+        # В групповых чатах игнорируем аудиофайлы (только voice и video_note)
+        if in_group:
+            return
+        ext = _EXT_MAP.get(message.audio.mime_type, ".mp3")
+        filename = f"audio{ext}"
+        status_text = "Расшифровываю аудио..."
 
-                # Разбиваем текст на части если он слишком длинный
-                parts = split_text(text)
+    media = message.voice or message.audio
 
-                if len(parts) == 1:
-                    # Текст умещается в одно сообщение
-                    keyboard = build_keyboard(text, status_msg.message_id)
-                    await safe_edit_message(
-                        status_msg,
-                        f"**Расшифровка:**\n\n{text}",
-                        reply_markup=keyboard
-                    )
-                else:
-                    # Текст слишком длинный - отправляем частями
-                    await safe_edit_message(
-                        status_msg,
-                        f"**Расшифровка (часть 1/{len(parts)}):**\n\n{parts[0]}"
-                    )
-                    for i, part in enumerate(parts[1:], start=2):
-                        if i == len(parts):
-                            # Последняя часть - с кнопками
-                            keyboard = build_keyboard(text, status_msg.message_id)
-                            await safe_send_message(
-                                message,
-                                f"**Часть {i}/{len(parts)}:**\n\n{part}",
-                                reply_markup=keyboard
-                            )
-                        else:
-                            await safe_send_message(
-                                message,
-                                f"**Часть {i}/{len(parts)}:**\n\n{part}"
-                            )
-            else:
-                await status_msg.edit_text("Не удалось распознать речь.")
-        finally:
-            os.unlink(tmp_path)
+    # Отправляем сообщение и сохраняем его, чтобы потом отредактировать
+    # В группах отвечаем реплаем на исходное сообщение
+    status_msg = await message.answer(
+        status_text,
+        reply_to_message_id=message.message_id if in_group else None
+    )
 
+    try:
+        await _transcribe_and_reply(
+            message, media.file_id, filename, status_msg,
+            file_unique_id=media.file_unique_id,
+        )
+    except TimeoutError:
+        logger.warning("Groq timeout while transcribing voice/audio")
+        await safe_edit_message(status_msg, "⚠️ Сервис распознавания отвечает слишком долго. Попробуйте ещё раз.", parse_mode=None)
     except Exception as e:
-        logger.exception("Error transcribing audio")
+        logger.exception("Error transcribing voice/audio")
         await safe_edit_message(status_msg, "⚠️ Ошибка при расшифровке. Попробуйте через минуту.", parse_mode=None)
 
 
+async def extract_audio(video_path: str, audio_path: str, timeout: int) -> bool:
+    """
+    Извлекает аудиодорожку из видео через ffmpeg.
+    Запускается как асинхронный подпроцесс, чтобы не блокировать event loop
+    на время конвертации. Возвращает True при успехе.
+    """
+    proc = await asyncio.create_subprocess_exec(
+        "ffmpeg", "-i", video_path,
+        "-vn",  # без видео
+        "-acodec", "libopus",  # кодек opus для ogg
+        "-b:a", "64k",  # битрейт
+        "-y",  # перезаписать если существует
+        audio_path,
+        stdout=asyncio.subprocess.DEVNULL,
+        stderr=asyncio.subprocess.PIPE,
+    )
+    try:
+        _, stderr = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+    except TimeoutError:
+        proc.kill()
+        await proc.communicate()
+        logger.error(f"FFmpeg timeout after {timeout}s")
+        return False
+
+    if proc.returncode != 0:
+        logger.error(f"FFmpeg error: {stderr.decode(errors='ignore')}")
+        return False
+    return True
+
+
+async def remove_temp_files(*paths: str) -> None:
+    """Удаляет временные файлы в пуле потоков, не трогая event loop."""
+    for path in paths:
+        if os.path.exists(path):
+            await asyncio.to_thread(os.unlink, path)
+
+
 @dp.message(F.content_type == "video")
 async def handle_video(message: Message) -> None:
     """Handle video files - extract audio and transcribe."""
@@ -906,12 +1254,6 @@ async def handle_video(message: Message) -> None:
     if is_group_chat(message):
         return
 
-    # Проверяем все требования
-    channel_ok, bot_ok = await check_all_requirements(message.from_user.id)
-    if not channel_ok or not bot_ok:
-        await send_requirements_message(message)
-        return
-
     status_msg = await message.answer("Извлекаю аудио из видео...")
 
     try:
@@ -926,91 +1268,46 @@ async def handle_video(message: Message) -> None:
                 )
                 return
             raise
-        file_bytes = await bot.download_file(file.file_path)
-
-        # Сохраняем видео во временный файл
+        # Резервируем временный файл и качаем видео сразу в него —
+        # без промежуточного BytesIO со всем файлом в памяти
         with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp_video:
-            tmp_video.write(file_bytes.read())
             video_path = tmp_video.name
+        await bot.download_file(file.file_path, destination=video_path)
 
         # Путь для извлечённого аудио
         audio_path = video_path.replace(".mp4", ".ogg")
 
         try:
             # Извлекаем аудио через ffmpeg
-            result = subprocess.run(
-                [
-                    "ffmpeg", "-i", video_path,
-                    "-vn",  # без видео
-                    "-acodec", "libopus",  # кодек opus для ogg
-                    "-b:a", "64k",  # битрейт
-                    "-y",  # перезаписать если существует
-                    audio_path
-                ],
-                capture_output=True,
-                text=True,
-                timeout=120  # таймаут 2 минуты
-            )
-
-            if result.returncode != 0:
-                logger.error(f"FFmpeg error: {result.stderr}")
+            if not await extract_audio(video_path, audio_path, timeout=120):
                 await safe_edit_message(status_msg, "⚠️ Не удалось извлечь аудио из видео.", parse_mode=None)
                 return
 
             await safe_edit_message(status_msg, "Расшифровываю...", parse_mode=None)
 
             # Транскрибируем аудио
+            # Отдаём Groq открытый файл: httpx стримит его сам,
+            # без загрузки всего аудио в память
             with open(audio_path, "rb") as audio_file:
-                transcription = call_audio_transcription(
-                    file=(audio_path, audio_file.read()),
-                    model="whisper-large-v3",
+                transcription = await call_audio_transcription(
+                    file=(audio_path, audio_file),
+                    model=pick_whisper_model(message.from_user.language_code),
                 )
 
-            raw_text = transcription.text.strip()
-            if raw_text:
-                # Исправляем пунктуацию через LLM
-                text = await fix_punctuation(raw_text)
-
-                # Сохраняем текст для последующих действий
-                transcriptions[status_msg.message_id] = text
-
-                # Разбиваем текст на части если он слишком длинный
-                parts = split_text(text)
-
-                if len(parts) == 1:
-                    keyboard = build_keyboard(text, status_msg.message_id)
-                    await safe_edit_message(
-                        status_msg,
-                        f"**Расшифровка видео:**\n\n{text}",
-                        reply_markup=keyboard
-                    )
-                else:
-                    await safe_edit_message(
-                        status_msg,
-                        f"**Расшифровка видео (часть 1/{len(parts)}):**\n\n{parts[0]}"
-                    )
-                    for i, part in enumerate(parts[1:], start=2):
-                        if i == len(parts):
-                            keyboard = build_keyboard(text, status_msg.message_id)
-                            await safe_send_message(
-                                message,
-                                f"**Часть {i}/{len(parts)}:**\n\n{part}",
-                                reply_markup=keyboard
-                            )
-                        else:
-                            await safe_send_message(
-                                message,
-                                f"**Часть {i}/{len(parts)}:**\n\n{part}"
-                            )
-            else:
-                await status_msg.edit_text("Не удалось распознать речь в видео.")
+            await reply_with_transcription(
+                message,
+                status_msg,
+                transcription.text.strip(),
+                header="Расшифровка видео",
+                empty_text="Не удалось распознать речь в видео.",
+            )
         finally:
             # Удаляем временные файлы
-            if os.path.exists(video_path):
-                os.unlink(video_path)
-            if os.path.exists(audio_path):
-                os.unlink(audio_path)
+            await remove_temp_files(video_path, audio_path)
 
+    except TimeoutError:
+        logger.warning("Groq timeout while transcribing video")
+        await safe_edit_message(status_msg, "⚠️ Сервис распознавания отвечает слишком долго. Попробуйте ещё раз.", parse_mode=None)
     except Exception as e:
         logger.exception("Error transcribing video")
         await safe_edit_message(status_msg, "⚠️ Ошибка при расшифровке видео. Попробуйте через минуту.", parse_mode=None)
@@ -1021,13 +1318,6 @@ async def handle_video_note(message: Message) -> None:
     """Handle video notes (круглые видеосообщения) - extract audio and transcribe."""
     in_group = is_group_chat(message)
 
-    # В личных чатах проверяем требования, в группах - пропускаем
-    if not in_group:
-        channel_ok, bot_ok = await check_all_requirements(message.from_user.id)
-        if not channel_ok or not bot_ok:
-            await send_requirements_message(message)
-            return
-
     # В группах отвечаем реплаем на исходное сообщение
     status_msg = await message.answer(
         "Расшифровываю видеосообщение...",
@@ -1046,137 +1336,160 @@ async def handle_video_note(message: Message) -> None:
                 )
                 return
             raise
-        file_bytes = await bot.download_file(file.file_path)
-
-        # Сохраняем видео во временный файл
+        # Резервируем временный файл и качаем видео сразу в него —
+        # без промежуточного BytesIO со всем файлом в памяти
         with tempfile.NamedTemporaryFile(suffix=".mp4", delete=False) as tmp_video:
-            tmp_video.write(file_bytes.read())
             video_path = tmp_video.name
+        await bot.download_file(file.file_path, destination=video_path)
 
         # Путь для извлечённого аудио
         audio_path = video_path.replace(".mp4", ".ogg")
 
         try:
             # Извлекаем аудио через ffmpeg
-            result = subprocess.run(
-                [
-                    "ffmpeg", "-i", video_path,
-                    "-vn",
-                    "-acodec", "libopus",
-                    "-b:a", "64k",
-                    "-y",
-                    audio_path
-                ],
-                capture_output=True,
-                text=True,
-                timeout=60
-            )
-
-            if result.returncode != 0:
-                logger.error(f"FFmpeg error: {result.stderr}")
+            if not await extract_audio(video_path, audio_path, timeout=60):
                 await safe_edit_message(status_msg, "⚠️ Не удалось извлечь аудио из видеосообщения.", parse_mode=None)
                 return
 
             # Транскрибируем аудио
+            # Отдаём Groq открытый файл: httpx стримит его сам,
+            # без загрузки всего аудио в память
             with open(audio_path, "rb") as audio_file:
-                transcription = call_audio_transcription(
-                    file=(audio_path, audio_file.read()),
-                    model="whisper-large-v3",
+                transcription = await call_audio_transcription(
+                    file=(audio_path, audio_file),
+                    model=pick_whisper_model(message.from_user.language_code),
                 )
 
-            raw_text = transcription.text.strip()
-            if raw_text:
-                # Исправляем пунктуацию через LLM
-                text = await fix_punctuation(raw_text)
-
-                # Сохраняем текст для последующих действий
-                transcriptions[status_msg.message_id] = text
-
-                # Разбиваем текст на части если он слишком длинный
-                parts = split_text(text)
-
-                if len(parts) == 1:
-                    keyboard = build_keyboard(text, status_msg.message_id)
-                    await safe_edit_message(
-                        status_msg,
-                        f"**Расшифровка:**\n\n{text}",
-                        reply_markup=keyboard
-                    )
-                else:
-                    await safe_edit_message(
-                        status_msg,
-                        f"**Расшифровка (часть 1/{len(parts)}):**\n\n{parts[0]}"
-                    )
-                    for i, part in enumerate(parts[1:], start=2):
-                        if i == len(parts):
-                            keyboard = build_keyboard(text, status_msg.message_id)
-                            await safe_send_message(
-                                message,
-                                f"**Часть {i}/{len(parts)}:**\n\n{part}",
-                                reply_markup=keyboard
-                            )
-                        else:
-                            await safe_send_message(
-                                message,
-                                f"**Часть {i}/{len(parts)}:**\n\n{part}"
-                            )
-            else:
-                await status_msg.edit_text("Не удалось распознать речь.")
+            await reply_with_transcription(message, status_msg, transcription.text.strip())
         finally:
-            if os.path.exists(video_path):
-                os.unlink(video_path)
-            if os.path.exists(audio_path):
-                os.unlink(audio_path)
+            await remove_temp_files(video_path, audio_path)
 
+    except TimeoutError:
+        logger.warning("Groq timeout while transcribing video note")
+        await safe_edit_message(status_msg, "⚠️ Сервис распознавания отвечает слишком долго. Попробуйте ещё раз.", parse_mode=None)
     except Exception as e:
         logger.exception("Error transcribing video note")
         await safe_edit_message(status_msg, "⚠️ Ошибка при расшифровке. Попробуйте через минуту.", parse_mode=None)
 
 
-@dp.callback_query(F.data.startswith("summary:"))
-async def handle_summary_callback(callback: CallbackQuery) -> None:
-    """
-    Обработчик нажатия кнопки 'Краткий пересказ'.
+# Очередь фоновых LLM-задач: обработчик кнопки лишь кладёт задачу и сразу
+# освобождает слот диспетчера aiogram, а пул воркеров (запускается в main)
+# выполняет пересказы/переводы и отправляет результаты
+llm_queue: asyncio.Queue = asyncio.Queue(maxsize=1000)
+LLM_WORKERS = 8
 
-    callback.data имеет формат "summary:message_id"
-    Извлекаем message_id, находим текст в словаре, делаем пересказ.
-    """
-    # Сразу отвечаем на callback чтобы убрать "часики" на кнопке
-    await callback.answer("Создаю пересказ...")
 
+async def _llm_worker() -> None:
+    """Вечный цикл воркера: берёт задачу из очереди и выполняет её."""
+    while True:
+        job = await llm_queue.get()
+        try:
+            await job()
+        except Exception:
+            logger.exception("Error in LLM worker")
+        finally:
+            llm_queue.task_done()
+
+
+def _enqueue_llm_job(callback: CallbackQuery, job) -> bool:
+    """Ставит задачу в очередь; False — очередь переполнена."""
     try:
-        # Извлекаем message_id из callback_data
-        message_id = int(callback.data.split(":")[1])
+        llm_queue.put_nowait(job)
+        return True
+    except asyncio.QueueFull:
+        return False
 
-        # Получаем оригинальный текст
-        text = transcriptions.get(message_id)
-        if not text:
-            await safe_send_message(callback, "Текст не найден. Возможно, бот был перезапущен.", parse_mode=None)
-            return
 
-        # Делаем пересказ через LLM
-        summary = await summarize_text(text)
+async def _summary_job(callback: CallbackQuery, message_id: int) -> None:
+    """Готовит пересказ (LLM при необходимости) и отправляет его."""
+    try:
+        summary = summaries.get(message_id)
+        if not summary:
+            # Получаем оригинальный текст
+            text = await get_transcription(message_id)
+            if not text:
+                await safe_send_message(callback, "Текст не найден. Возможно, бот был перезапущен.", parse_mode=None)
+                return
+
+            # Делаем пересказ через LLM
+            summary = await summarize_text(text)
+            summaries[message_id] = summary
 
         # Разбиваем на части если пересказ длинный
         parts = split_text(summary)
 
-        for i, part in enumerate(parts, start=1):
-            if len(parts) == 1:
-                await safe_send_message(
-                    callback,
-                    f"**Краткий пересказ:**\n\n{part}"
-                )
-            else:
-                await safe_send_message(
-                    callback,
-                    f"**Краткий пересказ (часть {i}/{len(parts)}):**\n\n{part}"
-                )
-
-    except Exception as e:
+        if len(parts) == 1:
+            await safe_send_message(
+                callback,
+                f"**Краткий пересказ:**\n\n{parts[0]}"
+            )
+        else:
+            await send_parts_concurrently(
+                callback,
+                [f"**Краткий пересказ (часть {i}/{len(parts)}):**\n\n{part}"
+                 for i, part in enumerate(parts, start=1)],
+            )
+    except Exception:
         logger.exception("Error creating summary")
         await safe_send_message(callback, "⚠️ Ошибка при создании пересказа. Попробуйте через минуту.", parse_mode=None)
 
 
+async def _translate_job(callback: CallbackQuery, message_id: int, target_lang: str) -> None:
+    """Готовит перевод (LLM при необходимости) и отправляет его."""
+    try:
+        translation = translations.get((message_id, target_lang))
+        if not translation:
+            # Получаем оригинальный текст
+            text = await get_transcription(message_id)
+            if not text:
+                await safe_send_message(callback, "Текст не найден. Возможно, бот был перезапущен.", parse_mode=None)
+                return
+
+            # Переводим через LLM
+            translation = await translate_text(text, target_lang)
+            translations[(message_id, target_lang)] = translation
+
+        # Разбиваем на части если перевод длинный
+        parts = split_text(translation)
+        lang_label = "русский" if target_lang == "ru" else "английский"
+
+        if len(parts) == 1:
+            await safe_send_message(
+                callback,
+                f"**Перевод на {lang_label}:**\n\n{parts[0]}"
+            )
+        else:
+            await send_parts_concurrently(
+                callback,
+                [f"**Перевод на {lang_label} (часть {i}/{len(parts)}):**\n\n{part}"
+                 for i, part in enumerate(parts, start=1)],
+            )
+    except Exception:
+        logger.exception("Error translating")
+        await safe_send_message(callback, "⚠️ Ошибка при переводе. Попробуйте через минуту.", parse_mode=None)
+
+
+@dp.callback_query(F.data.startswith("summary:"))
+async def handle_summary_callback(callback: CallbackQuery) -> None:
+    """
+    Обработчик нажатия кнопки 'Краткий пересказ'.
+
+    callback.data имеет формат "summary:message_id"
+    Предрасчитанный пересказ отдаём сразу, иначе ставим задачу воркерам —
+    обработчик не держит диспетчер на время LLM-вызова.
+    """
+    # Сразу отвечаем на callback чтобы убрать "часики" на кнопке
+    await callback.answer("Создаю пересказ...")
+
+    message_id = int(callback.data.split(":")[1])
+    if summaries.get(message_id):
+        await _summary_job(callback, message_id)
+        return
+
+    if not _enqueue_llm_job(callback, partial(_summary_job, callback, message_id)):
+        await safe_send_message(callback, "⚠️ Слишком много запросов. Попробуйте через минуту.", parse_mode=None)
+
+
 @dp.callback_query(F.data.startswith("translate:"))
 async def handle_translate_callback(callback: CallbackQuery) -> None:
     """
@@ -1187,40 +1500,17 @@ async def handle_translate_callback(callback: CallbackQuery) -> None:
     """
     await callback.answer("Перевожу...")
 
-    try:
-        # Парсим callback_data: "translate:ru:12345" или "translate:en:12345"
-        parts = callback.data.split(":")
-        target_lang = parts[1]
-        message_id = int(parts[2])
-
-        # Получаем оригинальный текст
-        text = transcriptions.get(message_id)
-        if not text:
-            await safe_send_message(callback, "Текст не найден. Возможно, бот был перезапущен.", parse_mode=None)
-            return
-
-        # Переводим через LLM
-        translation = await translate_text(text, target_lang)
+    # Парсим callback_data: "translate:ru:12345" или "translate:en:12345"
+    data = callback.data.split(":")
+    target_lang = data[1]
+    message_id = int(data[2])
 
-        # Разбиваем на части если перевод длинный
-        parts = split_text(translation)
-        lang_label = "русский" if target_lang == "ru" else "английский"
-
-        for i, part in enumerate(parts, start=1):
-            if len(parts) == 1:
-                await safe_send_message(
-                    callback,
-                    f"**Перевод на {lang_label}:**\n\n{part}"
-                )
-            else:
-                await safe_send_message(
-                    callback,
-                    f"**Перевод на {lang_label} (часть {i}/{len(parts)}):**\n\n{part}"
-                )
+    if translations.get((message_id, target_lang)):
+        await _translate_job(callback, message_id, target_lang)
+        return
 
-    except Exception as e:
-        logger.exception("Error translating")
-        await safe_send_message(callback, "⚠️ Ошибка при переводе. Попробуйте через минуту.", parse_mode=None)
+    if not _enqueue_llm_job(callback, partial(_translate_job, callback, message_id, target_lang)):
+        await safe_send_message(callback, "⚠️ Слишком много запросов. Попробуйте через минуту.", parse_mode=None)
 
 
 @dp.my_chat_member(ChatMemberUpdatedFilter(member_status_changed=IS_NOT_MEMBER >> (IS_MEMBER | ADMINISTRATOR)))
@@ -1693,9 +1983,7 @@ async def handle_start_with_deeplink(message: Message) -> None:
     )
 
     # Проверяем все требования
-    channel_ok, bot_ok = await check_all_requirements(message.from_user.id)
-    if not channel_ok or not bot_ok:
-        await send_requirements_message(message)
+    if not await check_requirements_or_prompt(message):
         return
 
     # Все требования выполнены - показываем приветственное сообщение
@@ -1720,9 +2008,7 @@ async def handle_start(message: Message) -> None:
     )
 
     # Проверяем все требования
-    channel_ok, bot_ok = await check_all_requirements(message.from_user.id)
-    if not channel_ok or not bot_ok:
-        await send_requirements_message(message)
+    if not await check_requirements_or_prompt(message):
         return
 
     # Все требования выполнены - показываем приветственное сообщение
@@ -1735,6 +2021,9 @@ async def handle_start(message: Message) -> None:
 
 @dp.callback_query(F.data == "check_requirements")
 async def handle_check_requirements(callback: CallbackQuery) -> None:
+    # Сбрасываем кэш — кнопка "Проверить" должна делать свежую проверку,
+    # иначе только что подписавшийся пользователь упрётся в устаревший False
+    _sub_cache.pop(callback.from_user.id, None)
     channel_ok, bot_ok = await check_all_requirements(callback.from_user.id)
     if channel_ok and bot_ok:
         await callback.answer("✅ Все условия выполнены!", show_alert=True)
@@ -1749,7 +2038,7 @@ async def handle_check_requirements(callback: CallbackQuery) -> None:
         else:
             await callback.answer("❌ Нажмите /start в боте ClevVPN!", show_alert=True)
         try:
-            await callback.message.edit_text(text, parse_mode="Markdown", reply_markup=keyboard)
+            await callback.message.edit_text(text, reply_markup=keyboard)
         except Exception:
             pass
 
@@ -1766,11 +2055,50 @@ async def handle_unknown(message: Message) -> None:
     )
 
 
+async def run_webhook() -> None:
+    """Запуск в режиме webhook: Telegram доставляет апдейты сам,
+    без задержки и лишних запросов getUpdates."""
+    from urllib.parse import urlparse
+
+    path = urlparse(WEBHOOK_URL).path or "/tg"
+    # Подписываемся только на типы апдейтов, у которых есть обработчики
+    await bot.set_webhook(WEBHOOK_URL, allowed_updates=dp.resolve_used_update_types())
+
+    app = web.Application()
+    SimpleRequestHandler(dispatcher=dp, bot=bot).register(app, path=path)
+    setup_application(app, dp, bot=bot)
+
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host="0.0.0.0", port=WEBHOOK_PORT)
+    await site.start()
+    logger.info(f"Webhook {WEBHOOK_URL} слушает порт {WEBHOOK_PORT}")
+    try:
+        await asyncio.Event().wait()
+    finally:
+        await bot.delete_webhook()
+        await runner.cleanup()
+
+
 async def main() -> None:
     logger.info("Starting bot...")
     await init_db()
     logger.info("Database initialized")
-    await dp.start_polling(bot)
+    workers = [asyncio.create_task(_llm_worker()) for _ in range(LLM_WORKERS)]
+    try:
+        if WEBHOOK_URL:
+            await run_webhook()
+        else:
+            # Подписываемся только на типы апдейтов, у которых есть обработчики:
+            # без лишних edited_message/poll/chat_member в каждом getUpdates
+            await dp.start_polling(bot, allowed_updates=dp.resolve_used_update_types())
+    finally:
+        for worker in workers:
+            worker.cancel()
+        if redis_client is not None:
+            await redis_client.aclose()
+        if shared_http is not None:
+            await shared_http.aclose()
 
 
 if __name__ == "__main__":